@@ -1,5 +1,8 @@
 import io
+import mmap
 import os
+import shutil
+import struct
 from builtins import ValueError
 import pandas as pd
 import numpy as np
@@ -10,6 +13,95 @@ from sudio.audioutils.sync import synchronize_audio
 from sudio.extras.timed_indexed_string import TimedIndexedString
 from sudio.types import DecodeError
 
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+
+# cache file header: size, frame rate, sample format, nchannels
+_HEADER_STRUCT = struct.Struct('<4Q')
+# read-ahead/write-behind buffer of the cache file objects
+_FILE_BUFFER_SIZE = 1 << 20
+# payloads from this size on are memory mapped instead of read when resynchronized
+_MMAP_MIN_SIZE = 1 << 22
+
+
+def _copy_file(src: io.BufferedIOBase, dst: io.BufferedIOBase, length: int = _FILE_BUFFER_SIZE) -> int:
+    """
+    Copies the remaining content of src into dst at its current position.
+
+    The copy runs in kernel space through os.sendfile where available, with
+    shutil.copyfileobj as the portable fallback.
+
+    Returns:
+    - Number of bytes copied.
+    """
+    src_start = src.tell()
+    dst_start = dst.tell()
+    copied = 0
+    if hasattr(os, 'sendfile'):
+        # sendfile writes through the descriptor, so land pending writes and
+        # move the raw position to the logical one first
+        dst.flush()
+        os.lseek(dst.fileno(), dst_start, os.SEEK_SET)
+        try:
+            remaining = os.fstat(src.fileno()).st_size - src_start
+            while remaining > 0:
+                sent = os.sendfile(dst.fileno(), src.fileno(), src_start + copied, remaining)
+                if not sent:
+                    break
+                copied += sent
+                remaining -= sent
+        except OSError:
+            # e.g. sendfile is not supported by the filesystem, finish the copy in user space
+            pass
+        # resync the buffered objects with the underlying descriptors and
+        # drop any read-ahead of dst that the copy may have overwritten
+        src.seek(src_start + copied)
+        dst.seek(0, os.SEEK_END)
+        dst.seek(dst_start + copied)
+
+    before = dst.tell()
+    shutil.copyfileobj(src, dst, length)
+    return copied + dst.tell() - before
+
+
+def _try_exclusive_open(path: str, mode: str = 'rb+') -> io.BufferedRandom:
+    """
+    Opens a cache file that is not in use by another record.
+
+    On POSIX a non-blocking exclusive advisory lock is taken on the file and held until
+    it is closed; 'w' modes only truncate the file once the lock is held. Elsewhere an
+    existing file is probed with an in-place rename, which fails while the file is opened
+    by another process.
+
+    Raises:
+    - OSError: If the file is in use or cannot be opened.
+    """
+    if fcntl is None:
+        if os.path.exists(path):
+            os.rename(path, path)
+        return open(path, mode, buffering=_FILE_BUFFER_SIZE)
+
+    truncate = 'w' in mode
+    if truncate:
+        # create without truncating, the file may still be held by another record
+        mode = mode.replace('w', 'r').replace('+', '') + '+'
+        file = open(path, mode, buffering=_FILE_BUFFER_SIZE,
+                    opener=lambda name, flags: os.open(name, flags | os.O_CREAT, 0o666))
+    else:
+        file = open(path, mode, buffering=_FILE_BUFFER_SIZE)
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        file.close()
+        raise
+    if truncate:
+        file.truncate()
+    return file
+
 
 def write_to_cached_file(*head,
                          head_dtype: str = 'u8',
@@ -48,7 +140,7 @@ def write_to_cached_file(*head,
     if buffered_random:
         file: io.BufferedRandom = buffered_random
     elif file_name:
-        file = open(file_name, file_mode)
+        file = open(file_name, file_mode, buffering=_FILE_BUFFER_SIZE)
     else:
         raise ValueError("Either buffered_random or file_name must be provided.")
     size = 0
@@ -63,14 +155,14 @@ def write_to_cached_file(*head,
         file.flush()
 
     if head:
-        size = file.write(np.asarray(head, dtype=head_dtype))
+        if head_dtype == 'u8' and len(head) == 4:
+            size = file.write(_HEADER_STRUCT.pack(*map(int, head)))
+        else:
+            size = file.write(np.asarray(head, dtype=head_dtype))
 
     if data:
         if isinstance(data, io.BufferedRandom):
-            buffer = data.read(data_chunk)
-            while buffer:
-                size += file.write(buffer)
-                buffer = data.read(data_chunk)
+            size += _copy_file(data, file, data_chunk)
         else:
             size += file.write(data)
 
@@ -85,6 +177,34 @@ def write_to_cached_file(*head,
     return file
 
 
+def _write_cache_record(file: io.BufferedRandom,
+                        header: Tuple[int, int, int, int],
+                        data: Union[bytes, bytearray, io.BufferedRandom]) -> io.BufferedRandom:
+    """
+    Rewrites a cache file with the given header and payload and leaves it positioned at the payload.
+
+    Fast path of write_to_cached_file for the layout handle_cached_record writes.
+
+    Parameters:
+    - file: Cache file opened for reading and writing.
+    - header: Size, frame rate, sample format and number of channels of the record.
+    - data: Bytes or BufferedRandom object holding the payload.
+
+    Returns:
+    - The cache file.
+    """
+    file.seek(0, 0)
+    file.truncate()
+    file.write(_HEADER_STRUCT.pack(*map(int, header)))
+    if isinstance(data, io.BufferedRandom):
+        _copy_file(data, file)
+    else:
+        file.write(data)
+    file.seek(_HEADER_STRUCT.size, 0)
+    file.flush()
+    return file
+
+
 def handle_cached_record(record: Union[pd.Series, dict],
                          path_server: TimedIndexedString,
                          master_obj,
@@ -118,38 +238,38 @@ def handle_cached_record(record: Union[pd.Series, dict],
     try:
         if path in cache:
             try:
-                os.rename(path, path)
-                f = record['o'] = open(path, 'rb+')
+                f = record['o'] = _try_exclusive_open(path)
             except OSError:
                 while True:
                     new_path: str = path_server()
                     try:
                         if os.path.exists(new_path):
-                            os.rename(new_path, new_path)
-                            f = record['o'] = open(new_path, 'rb+')
+                            f = record['o'] = _try_exclusive_open(new_path)
                         else:
                             # Write a new file based on the new path
-                            data_chunk = int(1e7)
-                            with open(path, 'rb+') as pre_file:
-                                f = record['o'] = open(new_path, 'wb+')
-                                data = pre_file.read(data_chunk)
-                                while data:
-                                    f.write(data)
-                                    data = pre_file.read(data_chunk)
-                            break
+                            with open(path, 'rb', buffering=_FILE_BUFFER_SIZE) as pre_file:
+                                f = record['o'] = _try_exclusive_open(new_path, 'wb+')
+                                _copy_file(pre_file, f)
+                        break
                     except OSError:
                         # If data already opened in another process, continue trying
                         continue
 
-            f.seek(0, 0)
-            cache_info = f.read(master_obj.__class__.CACHE_INFO)
+            if hasattr(os, 'pread'):
+                # positional read of the header, leaves the file position untouched
+                f.flush()
+                cache_info = os.pread(f.fileno(), master_obj.__class__.CACHE_INFO, 0)
+            else:
+                f.seek(0, 0)
+                cache_info = f.read(master_obj.__class__.CACHE_INFO)
             try:
-                csize, cframe_rate, csample_format, cnchannels = np.frombuffer(cache_info, dtype='u8').tolist()
-            except ValueError:
+                csize, cframe_rate, csample_format, cnchannels = _HEADER_STRUCT.unpack_from(cache_info)
+            except struct.error:
                 # Handle bad cache error
                 f.close()
                 os.remove(f.name)
                 raise DecodeError
+            f.seek(master_obj.__class__.CACHE_INFO, 0)
 
             csample_format = csample_format if csample_format else None
             record['size'] = csize
@@ -164,24 +284,34 @@ def handle_cached_record(record: Union[pd.Series, dict],
                 pass
 
             elif safe_load:
-                # Load data safely and synchronize audio
-                record['o'] = f.read()
-                record = synchronize_audio(record,
-                                            sync_nchannels,
-                                            sync_sample_rate,
-                                            sync_sample_format_id)
-
-                f = record['o'] = write_to_cached_file(record['size'],
+                # Load data safely and synchronize audio, synchronize_audio decodes
+                # the payload buffer in place without another copy
+                payload_size = os.fstat(f.fileno()).st_size - f.tell()
+                if payload_size >= _MMAP_MIN_SIZE:
+                    # serve large payloads straight from the page cache, the mapping
+                    # is closed before the file gets truncated and rewritten below
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                            memoryview(mapped)[f.tell():] as payload:
+                        record['o'] = payload
+                        record = synchronize_audio(record,
+                                                    sync_nchannels,
+                                                    sync_sample_rate,
+                                                    sync_sample_format_id)
+                else:
+                    payload = bytearray(payload_size)
+                    del payload[f.readinto(payload):]
+                    record['o'] = payload
+                    record = synchronize_audio(record,
+                                                sync_nchannels,
+                                                sync_sample_rate,
+                                                sync_sample_format_id)
+
+                f = record['o'] = _write_cache_record(f,
+                                                      (record['size'],
                                                        record['frameRate'],
                                                        record['sampleFormat'] if record['sampleFormat'] else 0,
-                                                       record['nchannels'],
-                                                       buffered_random=f,
-                                                       data=record['o'],
-                                                       pre_seek=(0, 0),
-                                                       pre_truncate=True,
-                                                       pre_flush=True,
-                                                       after_seek=(master_obj.__class__.CACHE_INFO, 0),
-                                                       after_flush=True)
+                                                       record['nchannels']),
+                                                      record['o'])
 
         else:
             raise DecodeError
@@ -195,27 +325,20 @@ def handle_cached_record(record: Union[pd.Series, dict],
         else:
             record['size'] = len(record['o']) + master_obj.CACHE_INFO
 
-        f = record['o'] = write_to_cached_file(record['size'],
+        f = record['o'] = _write_cache_record(_try_exclusive_open(path, 'wb+'),
+                                              (record['size'],
                                                record['frameRate'],
                                                record['sampleFormat'] if record['sampleFormat'] else 0,
-                                               record['nchannels'],
-                                               file_name=path,
-                                               data=record['o'],
-                                               pre_seek=(0, 0),
-                                               pre_truncate=True,
-                                               pre_flush=True,
-                                               after_seek=(master_obj.__class__.CACHE_INFO, 0),
-                                               after_flush=True)
+                                               record['nchannels']),
+                                              record['o'])
 
     record['duration'] = record['size'] / (record['frameRate'] *
                                            record['nchannels'] *
                                            Audio.get_sample_size(record['sampleFormat']))
     if isinstance(record, pd.Series):
         # Extract name information from file path for Series
-        post = record['o'].name.index(master_obj.__class__.BUFFER_TYPE)
-        pre = max(record['o'].name.rfind('\\'), record['o'].name.rfind('/'))
-        pre = (pre + 1) if pre > 0 else 0
-        record.name = record['o'].name[pre: post]
+        base = os.path.basename(record['o'].name)
+        record.name = base[:base.index(master_obj.__class__.BUFFER_TYPE)]
 
     return record
 
@@ -2,8 +2,16 @@ import numpy as np
 import samplerate
 
 from sudio.types import SampleFormat
-from sudio.audioutils.audio import Audio
-from sudio.audioutils.channel import shuffle2d_channels
+
+
+# numpy dtype of the raw samples for each sample format
+_FORMAT_DTYPE = {
+    SampleFormat.formatFloat32.value: np.dtype('<f4'),
+    SampleFormat.formatInt32.value: np.dtype('<i4'),
+    SampleFormat.formatInt16.value: np.dtype('<i2'),
+    SampleFormat.formatInt8.value: np.dtype('<i1'),
+    SampleFormat.formatUInt8.value: np.dtype('<i1'),
+}
 
 
 def synchronize_audio(rec,
@@ -27,6 +35,8 @@ def synchronize_audio(rec,
     Notes:
     - This function performs channel adjustment, resampling, and sample format conversion.
     - The input `rec` dictionary is modified in-place.
+    - Mono records can be upmixed to any number of channels, multi-channel records can only
+      keep or reduce their number of channels.
 
     Usage:
     ```python
@@ -41,63 +51,94 @@ def synchronize_audio(rec,
     :return: The synchronized audio recording data.
     """
 
-    form = Audio.get_sample_size(rec['sampleFormat'])
-    if rec['sampleFormat'] == SampleFormat.formatFloat32.value:
-        form = '<f{}'.format(form)
-    else:
-        form = '<i{}'.format(form)
-    data = np.frombuffer(rec['o'], form)
-    if rec['nchannels'] == 1:
-        if nchannels > rec['nchannels']:
-            data = np.vstack([data for i in range(nchannels)])
-            rec['nchannels'] = nchannels
-
-    # elif nchannels == 1 or _mono_mode:
-    #     data = np.mean(data.reshape(int(data.shape[-1:][0] / rec['nchannels']),
-    #                                 rec['nchannels']),
-    #                    axis=1)
-    else:
-        data = [[data[i::rec['nchannels']]] for i in range(nchannels)]
-        data = np.append(*data, axis=0)
-
-    if not sample_rate == rec['frameRate']:
-        scale = sample_rate / rec['frameRate']
-
-        # firwin = scisig.firwin(23, fc)
-        # firdn = lambda firwin, data,  scale: samplerate.resample(data, )
-        if len(data.shape) == 1:
-            # mono
-            data = samplerate.resample(data, scale, converter_type='sinc_fastest')
+    in_dtype = _FORMAT_DTYPE[rec['sampleFormat']]
+    out_dtype = _FORMAT_DTYPE[sample_format_id]
+
+    if (rec['nchannels'] == nchannels and
+            rec['frameRate'] == sample_rate and
+            rec['sampleFormat'] == sample_format_id and
+            output_data.startswith('b') and isinstance(rec['o'], bytes)):
+        # already synchronized, only refresh the metadata
+        rec['size'] = len(rec['o'])
+        rec['duration'] = rec['size'] / (sample_rate * nchannels * out_dtype.itemsize)
+        return rec
+
+    if 1 < rec['nchannels'] < nchannels:
+        raise ValueError('Can not upmix a {}-channel record to {} channels'.format(rec['nchannels'], nchannels))
+
+    data = np.frombuffer(rec['o'], in_dtype)
+    if sample_rate == rec['frameRate'] and output_data.startswith('b'):
+        # no resampling, remap the channels and cast straight from the interleaved
+        # input into the interleaved output in a single pass over the samples
+        frames = data.reshape(-1, rec['nchannels'])
+        if rec['nchannels'] == 1:
+            frames = np.broadcast_to(frames, (frames.shape[0], nchannels))
         else:
-            # multi channel
-            res = samplerate.resample(data[0], scale, converter_type='sinc_fastest')
-            for i in data[1:]:
-                res = np.vstack((res,
-                                 samplerate.resample(i, scale, converter_type='sinc_fastest')))
-            data = res
+            frames = frames[:, :nchannels]
+        # a fresh buffer per call is cheaper than a recycled one here: tobytes() copies
+        # out of it anyway, and pooled size-class buffers measured slower
+        out = np.empty(frames.shape, dtype=out_dtype)
+        np.copyto(out, frames, casting='unsafe')
+        rec['o'] = out.tobytes()
+        out_nchannels = frames.shape[1]
 
-    if output_data.startswith('b') and rec['nchannels'] > 1:
-        data = shuffle2d_channels(data)
-
-    rec['nchannels'] = nchannels
-    rec['sampleFormat'] = sample_format_id
-
-    form = Audio.get_sample_size(sample_format_id)
-    if sample_format_id == SampleFormat.formatFloat32.value:
-        form = '<f{}'.format(form)
     else:
-        form = '<i{}'.format(form)
+        # elif nchannels == 1 or _mono_mode:
+        #     data = np.mean(data.reshape(int(data.shape[-1:][0] / rec['nchannels']),
+        #                                 rec['nchannels']),
+        #                    axis=1)
+        if rec['nchannels'] > 1:
+            # deinterleave: (frames, channels) -> (channels, frames)
+            data = np.ascontiguousarray(data.reshape(-1, rec['nchannels']).T[:nchannels])
+
+        if not sample_rate == rec['frameRate']:
+            scale = sample_rate / rec['frameRate']
+
+            # firwin = scisig.firwin(23, fc)
+            # firdn = lambda firwin, data,  scale: samplerate.resample(data, )
+            if len(data.shape) == 1:
+                # mono
+                data = samplerate.resample(data, scale, converter_type='sinc_fastest')
+            else:
+                # multi channel. the first channel goes through the mono call, which sets the
+                # output length; libsamplerate may produce one more frame for interleaved
+                # (frames, channels) input, so the batched remaining channels are trimmed to it.
+                # the binding holds the GIL while converting, so batching beats resampling
+                # the channels on separate threads
+                first = samplerate.resample(data[0], scale, converter_type='sinc_fastest')
+                res = np.empty((data.shape[0], first.shape[0]), dtype=first.dtype)
+                res[0] = first
+                if data.shape[0] > 1:
+                    rest = samplerate.resample(data[1:].T, scale, converter_type='sinc_fastest')
+                    res[1:] = rest[:first.shape[0]].T
+                data = res
+
+        if rec['nchannels'] == 1 and nchannels > 1:
+            # upmix after resampling so the mono signal is converted only once,
+            # the read-only view is materialized by the cast below
+            data = np.broadcast_to(data, (nchannels, data.shape[0]))
+
+        if output_data.startswith('b'):
+            # cast and interleave (channels, frames) -> (frames, channels) in one pass
+            out = np.empty(data.shape[::-1], dtype=out_dtype)
+            np.copyto(out, data.T, casting='unsafe')
+            rec['o'] = out.tobytes()
+        elif data.flags.writeable and data.flags.owndata:
+            # private buffer of this call, cast only if the format differs
+            rec['o'] = data.astype(out_dtype, copy=False)
+        else:
+            # broadcast or caller buffer views, hand out a fresh writable array
+            rec['o'] = np.array(data, dtype=out_dtype)
+        out_nchannels = 1 if data.ndim == 1 else data.shape[0]
 
-    if output_data.startswith('b'):
-        rec['o'] = data.astype(form).tobytes()
-    else:
-        rec['o'] = data.astype(form)
+    rec['nchannels'] = out_nchannels
+    rec['sampleFormat'] = sample_format_id
 
     rec['size'] = len(rec['o'])
     rec['frameRate'] = sample_rate
 
     rec['duration'] = rec['size'] / (rec['frameRate'] *
                                      rec['nchannels'] *
-                                     Audio.get_sample_size(rec['sampleFormat']))
+                                     out_dtype.itemsize)
 
     return rec
\ No newline at end of file